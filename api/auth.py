@@ -43,7 +43,7 @@ class VerifyJWT:
         security_scopes: SecurityScopes, 
         token: HTTPAuthorizationCredentials | None = Depends(HTTPBearer())
     ) -> FBUser:
-        logger.info(f"Verifying JWT token with scopes ${security_scopes.scopes}")
+        logger.debug("Verifying JWT token with scopes %s", security_scopes.scopes)
         if settings.bypass_auth:
             # Bypass authentication for testing
             return _test_doctor
@@ -81,7 +81,7 @@ class VerifyJWT:
         except UnAuthorizedException:
             raise
         except Exception as e:
-            print(e)
+            logger.warning("Unexpected error verifying ID token: %s", e)
             raise UnAuthorizedException("ID token is invalid")
 
 verifier = VerifyJWT().verify
@@ -1,5 +1,7 @@
+from pydantic import field_validator
 from pydantic_settings import BaseSettings
 from pathlib import Path
+from typing import Literal
 from dotenv import load_dotenv
 from minio import Minio
 from minio.error import S3Error
@@ -19,6 +21,8 @@ This file verifies the environment variables required are populated
 """
 class EnvironmentSettings(BaseSettings):
     level: str
+    # Seconds between records logged from the same per-frame call site
+    log_sample_interval: float = 1.0
     google_application_credentials: str
     bypass_auth: bool = False
     minio_endpoint: str
@@ -32,7 +36,28 @@ class EnvironmentSettings(BaseSettings):
     db_port: str
     db_url: str
     db_schema: str
+    # Pose model, exported once for the onnx / openvino backends
+    model_path: str = "yolo11n-pose.pt"
+    inference_backend: Literal["pytorch", "onnx", "openvino"] = "pytorch"
+    inference_int8: bool = False
+    # Calibration dataset for INT8, ultralytics downloads it on first export
+    inference_int8_data: str = "coco8-pose.yaml"
+    # Max keypoint difference in pixels allowed between exported and PyTorch models
+    inference_tolerance: float = 5.0
+    inference_check_source: str | None = None
+    # Image sizes the feedback path may infer at, and the mean keypoint
+    # confidence required before it settles on a smaller one
+    feedback_imgsz: list[int] = [320, 416, 512, 640]
+    feedback_min_conf: float = 0.5
 
+    @field_validator("feedback_imgsz")
+    @classmethod
+    def check_feedback_imgsz(cls, sizes: list[int]) -> list[int]:
+        if not sizes:
+            raise ValueError("feedback_imgsz must contain at least one size")
+        if any(size <= 0 or size % 32 != 0 for size in sizes):
+            raise ValueError(f"feedback_imgsz sizes must be positive multiples of 32, got {sizes}")
+        return sizes
 
     class Config:
         # We will use dotenv to load the environment variables
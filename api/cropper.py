@@ -0,0 +1,156 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+from logger import frame_logger
+import numpy as np
+
+if TYPE_CHECKING:
+    from ultralytics import YOLO
+
+"""
+This file contains the preprocessing for feedback snapshots, which crops each frame
+to the patient and picks the smallest inference size that still finds them confidently.
+"""
+
+
+class NoPersonDetectedError(Exception):
+    """
+    Raised when a frame has nobody in it, e.g. the patient stepped out of view
+    """
+
+
+@dataclass
+class _Session:
+    size_idx: int
+    box: np.ndarray | None = None
+    streak: int = 0
+
+
+class AdaptiveCropper:
+    """
+    Runs pose inference on feedback snapshots as cheaply as a session allows.
+
+    After a confident frame, the patient's box is used to crop the next one, and the
+    image size is lowered after `patience` confident frames in a row. When a frame is
+    not confident it gets one more pass on the full image, a size up if the patient
+    was found, so a frame never costs more than two passes. The session only moves up
+    to the larger size if that pass was confident.
+
+    `model` should not be shared with anything calling `track`, as that permanently
+    registers tracker callbacks on it which reorder the detections.
+    """
+
+    def __init__(
+        self,
+        model: "YOLO",
+        sizes: list[int],
+        min_conf: float,
+        margin: float = 0.25,
+        patience: int = 10,
+        max_sessions: int = 256
+    ):
+        self.model = model
+        self.sizes = sorted(sizes)
+        self.min_conf = min_conf
+        self.margin = margin
+        self.patience = patience
+        self.max_sessions = max_sessions
+        self._sessions: OrderedDict[object, _Session] = OrderedDict()
+
+    def infer(self, session: object, image: np.ndarray, visible: np.ndarray | None = None) -> np.ndarray:
+        """
+        Returns the (17, 3) keypoints of the patient in full image coordinates.
+
+        Confidence is the mean over the `visible` keypoints only, e.g. those seen in the
+        reference pose, so exercises with part of the body out of frame still count.
+        """
+        state = self._get_session(session)
+        top = len(self.sizes) - 1
+
+        size_idx = state.size_idx
+        kpts, box = self._run(image, state.box, size_idx)
+        score = self._score(kpts, visible)
+
+        if score < self.min_conf:
+            retry_idx = min(size_idx + 1, top) if kpts is not None else size_idx
+            # Only retry if the full frame or a larger size could change the outcome
+            if state.box is not None or retry_idx != size_idx:
+                retry_kpts, retry_box = self._run(image, None, retry_idx)
+                retry_score = self._score(retry_kpts, visible)
+                if retry_score > score:
+                    kpts, box, score = retry_kpts, retry_box, retry_score
+                    if score >= self.min_conf:
+                        size_idx = retry_idx
+
+        if kpts is None:
+            state.box = None
+            state.streak = 0
+            raise NoPersonDetectedError("No person detected in frame")
+
+        confident = score >= self.min_conf
+        frame_logger.debug(
+            "Inferred session %s at imgsz %d (confidence=%.2f)",
+            session, self.sizes[size_idx], score
+        )
+
+        state.box = box if confident else None
+        if size_idx != state.size_idx or not confident:
+            state.size_idx = size_idx
+            state.streak = 0
+        else:
+            state.streak += 1
+            if state.streak >= self.patience and state.size_idx > 0:
+                state.size_idx -= 1
+                state.streak = 0
+
+        return kpts
+
+    def _score(self, kpts: np.ndarray | None, visible: np.ndarray | None) -> float:
+        """
+        Mean confidence of the `visible` keypoints, -1 if nobody was found
+        """
+        if kpts is None:
+            return -1.0
+        conf = kpts[:, 2] if visible is None or not visible.any() else kpts[visible, 2]
+        return float(conf.mean())
+
+    def _run(self, image: np.ndarray, box: np.ndarray | None, size_idx: int) -> tuple[np.ndarray | None, np.ndarray | None]:
+        """
+        Predicts on `image` cropped to `box`, mapping the results back to full image coordinates
+        """
+        crop, offset = self._crop(image, box)
+        kpts, det_box = self._predict(crop, self.sizes[size_idx])
+        if kpts is None:
+            return None, None
+        kpts[:, :2] += offset
+        return kpts, det_box + np.tile(offset, 2)
+
+    def _get_session(self, session: object) -> _Session:
+        state = self._sessions.pop(session, None) or _Session(size_idx=len(self.sizes) - 1)
+        self._sessions[session] = state
+        if len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+        return state
+
+    def _crop(self, image: np.ndarray, box: np.ndarray | None) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Crops to `box` grown by `margin` on every side. Returns the crop and its offset.
+        """
+        if box is None:
+            return image, np.zeros(2, dtype=np.float32)
+
+        height, width = image.shape[:2]
+        x1, y1, x2, y2 = box
+        pad_x, pad_y = (x2 - x1) * self.margin, (y2 - y1) * self.margin
+        x1, x2 = int(max(x1 - pad_x, 0)), int(min(x2 + pad_x, width))
+        y1, y2 = int(max(y1 - pad_y, 0)), int(min(y2 + pad_y, height))
+
+        if x2 - x1 < 32 or y2 - y1 < 32:
+            return image, np.zeros(2, dtype=np.float32)
+        return image[y1:y2, x1:x2], np.array([x1, y1], dtype=np.float32)
+
+    def _predict(self, image: np.ndarray, imgsz: int) -> tuple[np.ndarray | None, np.ndarray | None]:
+        result = self.model.predict(source=image, imgsz=imgsz, verbose=False)[0]
+        if result.keypoints is None or len(result.boxes) == 0:
+            return None, None
+        return result.keypoints.data.cpu().numpy()[0], result.boxes.xyxy.cpu().numpy()[0]
@@ -0,0 +1,177 @@
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from ultralytics import YOLO
+from ultralytics.utils import ASSETS
+from ultralytics.utils.downloads import attempt_download_asset
+from ultralytics.utils.metrics import box_iou
+from config import settings
+from logger import logger
+import numpy as np
+import cv2
+import fcntl
+import os
+import shutil
+
+"""
+This file loads the pose model for the configured inference backend.
+
+Exported models (ONNX / OpenVINO) are generated once next to the PyTorch checkpoint
+and reused on later startups. Every time one is loaded, its keypoints are checked
+against the PyTorch model so a bad export or INT8 quantization is caught at startup.
+"""
+
+EXPORT_FORMATS = {"onnx", "openvino"}
+# ultralytics' default image size
+DEFAULT_IMGSZ = 640
+
+
+def exported_model_path(weights: Path, backend: str, int8: bool) -> Path:
+    """
+    The path ultralytics writes the export for `weights` to
+    """
+    if backend == "onnx":
+        return weights.with_suffix(".onnx")
+    suffix = "_int8_openvino_model" if int8 else "_openvino_model"
+    return weights.with_name(f"{weights.stem}{suffix}")
+
+
+def export_model(weights: Path, backend: str, int8: bool, data: str | None = None) -> Path:
+    """
+    Exports the PyTorch checkpoint for the given backend, unless it already has been.
+    `data` is the dataset INT8 quantization is calibrated on.
+
+    Every worker loads the model at startup, so the export is guarded by a file lock
+    and only the first worker to get it does the work. The export is written to a
+    temporary directory and moved into place once complete, so a worker never loads
+    a half written model, and a crashed export is redone on the next startup.
+    """
+    if backend not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported inference backend: {backend}")
+    if int8 and backend != "openvino":
+        raise ValueError("INT8 quantization is only supported with the openvino backend")
+
+    path = exported_model_path(weights, backend, int8)
+
+    with open(path.with_name(f"{path.name}.export.lock"), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            if _is_exported(path, weights, backend):
+                return path
+
+            logger.info("Exporting %s to %s (int8=%s)", weights, backend, int8)
+            with TemporaryDirectory(dir=path.parent, prefix=".export-") as tmp:
+                tmp_weights = Path(tmp) / weights.name
+                # The stock checkpoints are downloaded on first use
+                shutil.copy(attempt_download_asset(str(weights)), tmp_weights)
+                # Dynamic input shapes let the feedback path pick its own image size
+                exported = YOLO(str(tmp_weights)).export(
+                    format=backend, int8=int8, data=data if int8 else None, dynamic=True
+                )
+
+                # Clear out anything left behind by an export that crashed
+                if path.is_dir():
+                    shutil.rmtree(path)
+                os.replace(Path(exported), path)
+            return path
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def _is_exported(path: Path, weights: Path, backend: str) -> bool:
+    """
+    Whether `path` holds a complete export. OpenVINO writes a directory, which is only
+    usable once it has the model's .xml in it.
+    """
+    if backend == "openvino":
+        return (path / weights.with_suffix(".xml").name).is_file()
+    return path.is_file()
+
+
+def check_equivalence(
+    model: YOLO,
+    reference: YOLO,
+    source: str | Path,
+    tolerance: float,
+    sizes: list[int],
+    box_conf: float = 0.5,
+    kpt_conf: float = 0.5,
+    min_iou: float = 0.5
+) -> float:
+    """
+    Runs both models on `source` at every image size in `sizes` and raises if any
+    keypoint above `kpt_conf` differs from the reference by more than `tolerance` pixels.
+    Returns the largest difference.
+
+    Each reference detection above `box_conf` is paired with the exported detection whose
+    box overlaps it most. People found by only one model are ignored, since the backends
+    letterbox differently and borderline detections can come and go.
+    """
+    max_dist = 0.0
+    for imgsz in sizes:
+        result, ref = (
+            m.predict(source=source, imgsz=imgsz, verbose=False)[0] for m in (model, reference)
+        )
+
+        confident = ref.boxes.conf >= box_conf
+        if len(result.boxes) == 0 or not confident.any():
+            raise ValueError(f"No people detected in {source} at imgsz {imgsz}, cannot check equivalence")
+
+        ious = box_iou(ref.boxes.xyxy[confident], result.boxes.xyxy).cpu().numpy()
+        matched = ious.max(axis=1) >= min_iou
+        if not matched.any():
+            raise ValueError(
+                f"No matching people detected in {source} at imgsz {imgsz}, cannot check equivalence"
+            )
+
+        kpts = result.keypoints.data.cpu().numpy()[ious.argmax(axis=1)[matched]]
+        ref_kpts = ref.keypoints.data[confident].cpu().numpy()[matched]
+
+        mask = (kpts[..., 2] > kpt_conf) & (ref_kpts[..., 2] > kpt_conf)
+        dists = np.linalg.norm(kpts[..., :2] - ref_kpts[..., :2], axis=-1)[mask]
+        dist = float(dists.max()) if dists.size else 0.0
+
+        if dist > tolerance:
+            raise ValueError(
+                f"Exported model keypoints differ by up to {dist:.2f}px at imgsz {imgsz} "
+                f"(tolerance {tolerance}px)"
+            )
+        max_dist = max(max_dist, dist)
+    return max_dist
+
+
+def prepare_model() -> str:
+    """
+    Prepares the pose model for `settings.inference_backend` and returns the path to
+    load it from. Exported models are checked against PyTorch before being returned,
+    so callers can build as many YOLO instances from the path as they need.
+    """
+    weights = Path(settings.model_path)
+    backend = settings.inference_backend
+
+    if backend == "pytorch":
+        return str(weights)
+
+    path = export_model(weights, backend, settings.inference_int8, settings.inference_int8_data)
+    model = YOLO(str(path), task="pose")
+
+    # pose_estimation runs at the default size, the feedback path at feedback_imgsz
+    sizes = sorted({DEFAULT_IMGSZ, *settings.feedback_imgsz})
+    source = settings.inference_check_source or ASSETS / "bus.jpg"
+    max_dist = check_equivalence(
+        model, YOLO(str(weights)), source, settings.inference_tolerance, sizes
+    )
+    logger.info(
+        "Loaded %s model %s, max keypoint difference %.2fpx from PyTorch at sizes %s",
+        backend, path, max_dist, sizes
+    )
+    return str(path)
+
+
+def decode_image(data: bytes) -> np.ndarray:
+    """
+    Decodes an uploaded jpeg / png into a BGR array without going through disk
+    """
+    image = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError("Could not decode image")
+    return image
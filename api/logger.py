@@ -1,21 +1,131 @@
+import atexit
+import json
 import logging
 import logging.config
+import sys
+import time
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener
+from queue import SimpleQueue
 from config import settings
 
 ROOT_LEVEL = settings.level.upper() if settings.level else "INFO"
 
+"""
+Logging is done through a queue so that the event loop never blocks on stdout.
+Records are put on the queue by the caller and written out as JSON lines by a
+QueueListener running in its own thread.
+"""
+
+# Set per request by the middleware in main.py so every record can be correlated
+request_id_ctx: ContextVar[str | None] = ContextVar("request_id", default=None)
+
+_RESERVED_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+
+class RequestIdFilter(logging.Filter):
+    """
+    Stamps the current request id on the record. This has to run on the
+    caller's side of the queue, since the listener thread has no request context.
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_ctx.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Rate limits records logged with the same message template so that per-frame
+    paths only emit one record per interval. Warnings and errors always pass.
+    The number of dropped records is attached to the next emitted one.
+    """
+
+    def __init__(self, interval: float = 1.0):
+        super().__init__()
+        self.interval = interval
+        self._last: dict[tuple[str, object], float] = {}
+        self._suppressed: dict[tuple[str, object], int] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or self.interval <= 0:
+            return True
+
+        key = (record.name, record.msg)
+        now = time.monotonic()
+        last = self._last.get(key)
+        if last is not None and now - last < self.interval:
+            self._suppressed[key] = self._suppressed.get(key, 0) + 1
+            return False
+
+        self._last[key] = now
+        suppressed = self._suppressed.pop(key, 0)
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats a record as a single JSON line. Any `extra` fields are included.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "timestamp": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+
+        for key, value in vars(record).items():
+            if key not in _RESERVED_ATTRS:
+                payload[key] = value
+
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            payload["exc_info"] = record.exc_text
+
+        return json.dumps(payload, default=str)
+
+
+class _QueueHandler(QueueHandler):
+    """
+    The default QueueHandler folds the traceback into the message; we keep it
+    separate so the JsonFormatter can put it in its own field.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = logging.makeLogRecord(vars(record))
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+_log_queue: SimpleQueue = SimpleQueue()
+
+_stream_handler = logging.StreamHandler(sys.stdout)  # Default is stderr
+_stream_handler.setFormatter(JsonFormatter())
+
+listener = QueueListener(_log_queue, _stream_handler, respect_handler_level=True)
+
 LOGGING_CONFIG = {
     "version": 1,
     "disable_existing_loggers": True,
-    "formatters": {
-        "standard": {"format": "%(asctime)s [%(levelname)s] %(name)s: %(message)s"},
+    "filters": {
+        "request_id": {"()": RequestIdFilter},
+        "sampled": {"()": SamplingFilter, "interval": settings.log_sample_interval},
     },
     "handlers": {
         "default": {
-            "level": "INFO",
-            "formatter": "standard",
-            "class": "logging.StreamHandler",
-            "stream": "ext://sys.stdout",  # Default is stderr
+            "()": _QueueHandler,
+            "queue": _log_queue,
+            "level": ROOT_LEVEL,
+            "filters": ["request_id"],
         },
     },
     "loggers": {
@@ -24,17 +134,28 @@ LOGGING_CONFIG = {
             "handlers": ["default"],
             "propagate": False,
         },
+        "frames": {
+            # Per-frame hot paths, propagates to the root handler
+            "filters": ["sampled"],
+        },
         "uvicorn.error": {
             "level": "DEBUG",
             "handlers": ["default"],
+            "propagate": False,
         },
         "uvicorn.access": {
             "level": "DEBUG",
             "handlers": ["default"],
+            "propagate": False,
         },
     },
 }
 
 logging.config.dictConfig(LOGGING_CONFIG)
+listener.start()
+atexit.register(listener.stop)
 
 logger = logging.getLogger(__name__)
+
+# Use this for anything logged on every frame or every request
+frame_logger = logging.getLogger("frames")
@@ -1,6 +1,47 @@
 from fastapi import FastAPI, Security
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 from router import router, video_router
+from logger import request_id_ctx
+import re
+import uuid
+
+# Client supplied ids end up in every log record, so only accept short, plain ones
+_REQUEST_ID_PATTERN = re.compile(r"[A-Za-z0-9._-]{1,64}")
+
+class RequestIdMiddleware:
+    """
+    Tags every log record emitted while handling a request with its id.
+    Clients may pass their own X-Request-ID to correlate with their logs, anything
+    not matching _REQUEST_ID_PATTERN is replaced with a generated one.
+
+    This is a plain ASGI middleware so the id stays set until the response has
+    been sent, which covers uvicorn's access log and streamed responses.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = Headers(scope=scope).get("x-request-id")
+        if not request_id or not _REQUEST_ID_PATTERN.fullmatch(request_id):
+            request_id = uuid.uuid4().hex
+
+        async def send_with_request_id(message: Message):
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message)["X-Request-ID"] = request_id
+            await send(message)
+
+        token = request_id_ctx.set(request_id)
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            request_id_ctx.reset(token)
 
 app = FastAPI()
 
@@ -15,5 +56,7 @@ app.add_middleware(
     allow_headers=["*"]
 )
 
+app.add_middleware(RequestIdMiddleware)
+
 app.include_router(router)
 app.include_router(video_router)
@@ -10,14 +10,22 @@ import random
 import string
 from typing import Literal
 from init_db import conn, getDictCursor
-from logger import logger
+from logger import logger, frame_logger
+from inference import prepare_model, decode_image
+from cropper import AdaptiveCropper, NoPersonDetectedError
 from ultralytics import YOLO
 from tempfile import NamedTemporaryFile
 import numpy as np
 import asyncio
 
 
-model = YOLO("yolo11n-pose.pt")
+model_path = prepare_model()
+model = YOLO(model_path, task="pose")
+# The cropper gets its own instance since `model.track` in pose_estimation
+# permanently adds tracker callbacks to the model it runs on
+cropper = AdaptiveCropper(
+    YOLO(model_path, task="pose"), settings.feedback_imgsz, settings.feedback_min_conf
+)
 ALLOWED_MIME = {"video/mp4", "video/quicktime"}
 
 
@@ -88,14 +96,15 @@ async def feedback_websocket(
             if (not tmp): return 0.0
 
             pose = Pose.model_validate(tmp)
-            logger.info(f"Downloaded poses for {object_name} - video frame {get_frame}")
+            frame_logger.info("Downloaded poses for %s - video frame %s", object_name, get_frame)
 
-        with NamedTemporaryFile(suffix=".jpg") as tmp:
-            tmp.write(await file.read())
-            tmp.flush()
-            results = model.track(source=tmp.name)
-            kpts_array = results[0].keypoints.data.cpu().numpy()[0]
-            keypoints = np.array(pose.keypoints)
+        # Poses are stored for every person in the frame, compare against the first
+        keypoints = np.array(pose.keypoints).reshape(-1, 17, 3)[0]
+        # Only the keypoints seen in the reference pose count towards confidence
+        visible = keypoints[:, 2] > 0.5
+
+        image = decode_image(await file.read())
+        kpts_array = cropper.infer((user.uid, object_name), image, visible)
 
         dists = np.linalg.norm(kpts_array[:, :2] - keypoints[:, :2], axis=1)
 
@@ -106,8 +115,12 @@ async def feedback_websocket(
         weights = (kpts_array[:, 2] + kpts_array[:, 2]) / 2
         weighted_mean = (dists * weights).sum() / weights.sum()
 
-        logger.info(f"Calculated mean distance: {weighted_mean}")
+        frame_logger.info("Calculated mean distance: %s", weighted_mean)
         return {'weighted_mean': weighted_mean, 'mean_all': mean_all, 'mean_thresh': mean_thresh}
+    except NoPersonDetectedError:
+        # Expected whenever the patient steps out of frame, so keep it out of the error logs
+        frame_logger.info("No person detected in feedback frame for %s", object_name)
+        raise HTTPException(status_code=422, detail="No person detected in frame")
     except Exception as e:
         logger.error("Error %s:", e)
         raise HTTPException(status_code=500, detail="Internal Server Error")
@@ -253,7 +266,7 @@ async def handle_doctor_video(
             return video
     except Exception as e:
         conn.rollback()
-        logger.error("Error in handle_doctor_video: %e", e)
+        logger.error("Error in handle_doctor_video: %s", e)
         raise HTTPException(status_code=500, detail="Internal Server Error")
 
 
@@ -273,7 +286,7 @@ async def get_videos(user: FBUser = Security(verifier, scopes=default_scopes)):
             videos = [Video.model_validate(row) for row in result]
             return videos
     except Exception as e:
-        logger.error("Error in get_videos: %e", e)
+        logger.error("Error in get_videos: %s", e)
         raise HTTPException(status_code=500, detail="Internal Server Error")
 
 @video_router.get("/download/{object_name:path}", status_code=200)
@@ -333,10 +346,10 @@ async def set_user_role(payload: Role, user: FBUser = Security(verifier)):
         role = payload.role
 
         admin_auth.set_custom_user_claims(user.uid, {"role": role})
-        print(f"Role '{role}' set successfully")
+        logger.info("Role '%s' set successfully", role)
 
         connect_code = generate_connect_code()
-        print(f"[DEBUG] Role '{role}' set with connect_code: {connect_code}")
+        logger.debug("Role '%s' set with connect_code: %s", role, connect_code)
 
         with conn.cursor() as cur:
             if role == "doctor":
@@ -406,7 +419,7 @@ async def connect_users(payload: Code, user: FBUser = Security(verifier, scopes=
         return {"message": "Connected successfully"}
 
     except Exception as e:
-        print("Error in /connect:", e)
+        logger.error("Error in /connect: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -449,7 +462,7 @@ async def get_connect_code(user: FBUser = Security(verifier, scopes=default_scop
 
             return {"connect_code": result[0]}
     except Exception as e:
-        print("Error in /connect-code:", e)
+        logger.error("Error in /connect-code: %s", e)
         raise HTTPException(status_code=500, detail="Internal Server Error")
 
 
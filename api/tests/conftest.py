@@ -0,0 +1,11 @@
+import sys
+import types
+from pathlib import Path
+
+# The api modules are imported as top level modules, as `fastapi run main.py` does
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+# config.py connects to Firebase and MinIO on import, the modules under test only need settings
+_config = types.ModuleType("config")
+_config.settings = types.SimpleNamespace(level="INFO", log_sample_interval=1.0)
+sys.modules.setdefault("config", _config)
@@ -0,0 +1,158 @@
+from types import SimpleNamespace
+import numpy as np
+import pytest
+from cropper import AdaptiveCropper, NoPersonDetectedError
+
+SIZES = [320, 416, 512, 640]
+
+
+class _Tensor:
+    def __init__(self, array: np.ndarray):
+        self.array = array
+
+    def cpu(self):
+        return self
+
+    def numpy(self):
+        return self.array
+
+
+class _Boxes:
+    def __init__(self, box: np.ndarray):
+        self.xyxy = _Tensor(box)
+
+    def __len__(self):
+        return len(self.xyxy.array)
+
+
+class StubModel:
+    """
+    Finds the "person" as the bright pixels in the image, with keypoints at the
+    box corners. Confidence only depends on the image size, set through `conf`,
+    and is 0 for the keypoints in `hidden`.
+    """
+
+    def __init__(self, conf: dict[int, float], hidden: np.ndarray | None = None):
+        self.conf = conf
+        self.hidden = np.zeros(17, dtype=bool) if hidden is None else hidden
+        self.calls: list[tuple[tuple[int, ...], int]] = []
+
+    def predict(self, source: np.ndarray, imgsz: int, verbose: bool):
+        self.calls.append((source.shape[:2], imgsz))
+        ys, xs = np.nonzero(source[..., 0])
+        if xs.size == 0:
+            return [SimpleNamespace(keypoints=None, boxes=_Boxes(np.zeros((0, 4))))]
+
+        box = np.array([[xs.min(), ys.min(), xs.max(), ys.max()]], dtype=np.float32)
+        kpts = np.zeros((1, 17, 3), dtype=np.float32)
+        kpts[0, :, :2] = box[0, :2]
+        kpts[0, 1, :2] = box[0, 2:]
+        kpts[0, :, 2] = np.where(self.hidden, 0.0, self.conf[imgsz])
+
+        return [SimpleNamespace(keypoints=SimpleNamespace(data=_Tensor(kpts)), boxes=_Boxes(box))]
+
+
+def _frame(box=(600, 200, 700, 500)) -> np.ndarray:
+    image = np.zeros((720, 1280, 3), dtype=np.uint8)
+    if box is not None:
+        x1, y1, x2, y2 = box
+        image[y1:y2 + 1, x1:x2 + 1] = 255
+    return image
+
+
+def test_crops_to_previous_box_and_maps_back():
+    model = StubModel({size: 0.9 for size in SIZES})
+    cropper = AdaptiveCropper(model, SIZES, min_conf=0.5)
+
+    first = cropper.infer("s", _frame())
+    second = cropper.infer("s", _frame())
+
+    assert model.calls[0][0] == (720, 1280)
+    # 100x300 box grown by 25% on every side
+    assert model.calls[1][0] == (450, 150)
+    np.testing.assert_allclose(second, first)
+    np.testing.assert_allclose(second[0, :2], [600, 200])
+    np.testing.assert_allclose(second[1, :2], [700, 500])
+
+
+def test_steps_down_after_patience():
+    model = StubModel({size: 0.9 for size in SIZES})
+    cropper = AdaptiveCropper(model, SIZES, min_conf=0.5, patience=2)
+
+    for _ in range(5):
+        cropper.infer("s", _frame())
+
+    assert [imgsz for _, imgsz in model.calls] == [640, 640, 512, 512, 416]
+
+
+def test_low_confidence_is_at_most_one_pass_at_top_size():
+    model = StubModel({size: 0.2 for size in SIZES})
+    cropper = AdaptiveCropper(model, SIZES, min_conf=0.5)
+
+    for _ in range(3):
+        cropper.infer("s", _frame())
+
+    # Never confident, so never cropped and nothing larger to retry at
+    assert model.calls == [((720, 1280), 640)] * 3
+
+
+def test_retry_at_larger_size_only_sticks_when_confident():
+    model = StubModel({320: 0.9, 416: 0.3, 512: 0.4, 640: 0.9})
+    cropper = AdaptiveCropper(model, SIZES, min_conf=0.5, patience=1)
+
+    cropper.infer("s", _frame())  # 640, confident, steps down to 512
+    kpts = cropper.infer("s", _frame())  # 512 on the crop, retry at 640 on the full frame
+
+    assert model.calls[1:] == [((450, 150), 512), ((720, 1280), 640)]
+    assert kpts[0, 2] == pytest.approx(0.9)
+    assert cropper._sessions["s"].size_idx == 3
+
+    model.conf = {320: 0.9, 416: 0.3, 512: 0.4, 640: 0.35}
+    cropper._sessions["s"].size_idx = 2
+    cropper._sessions["s"].box = None
+    kpts = cropper.infer("s", _frame())
+
+    # The retry was worse, so the first pass is kept and the size stays put
+    assert kpts[0, 2] == pytest.approx(0.4)
+    assert cropper._sessions["s"].size_idx == 2
+
+
+def test_visible_keypoints_decide_confidence():
+    visible = np.zeros(17, dtype=bool)
+    visible[:5] = True
+    model = StubModel({size: 0.9 for size in SIZES}, hidden=~visible)
+
+    cropper = AdaptiveCropper(model, SIZES, min_conf=0.5)
+    cropper.infer("s", _frame(), visible)
+    assert cropper._sessions["s"].box is not None
+
+    # Over all 17 keypoints the mean is too low to count as confident
+    cropper = AdaptiveCropper(model, SIZES, min_conf=0.5)
+    cropper.infer("s", _frame())
+    assert cropper._sessions["s"].box is None
+
+
+def test_no_person_raises_and_clears_box():
+    model = StubModel({size: 0.9 for size in SIZES})
+    cropper = AdaptiveCropper(model, SIZES, min_conf=0.5)
+    cropper.infer("s", _frame())
+
+    with pytest.raises(NoPersonDetectedError):
+        cropper.infer("s", _frame(box=None))
+
+    # One pass on the crop, one on the full frame
+    assert len(model.calls) == 3
+    assert cropper._sessions["s"].box is None
+    assert cropper._sessions["s"].size_idx == 3
+
+
+def test_evicts_least_recently_used_session():
+    model = StubModel({size: 0.9 for size in SIZES})
+    cropper = AdaptiveCropper(model, SIZES, min_conf=0.5, max_sessions=2)
+
+    cropper.infer("a", _frame())
+    cropper.infer("b", _frame())
+    cropper.infer("a", _frame())
+    cropper.infer("c", _frame())
+
+    assert list(cropper._sessions) == ["a", "c"]